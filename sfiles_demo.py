@@ -2,13 +2,14 @@
 SFILES 2.0 Demonstration Script
 Converts Process Flow Diagrams (PFDs) to SFILES text representation
 """
+import io
 import os
-import sys
-import glob
+import re
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from enum import IntEnum
 from pathlib import Path
-import matplotlib.pyplot as plt
-from PIL import Image
-import numpy as np
 import networkx as nx
 
 # Try to import from the official SFILES2 package first
@@ -20,20 +21,67 @@ except ImportError:
     HAS_SFILES2 = False
     print("SFILES2 package not installed, using mock implementation")
 
-# Add the Flowsheet_Class directory to the Python path
-sys.path.append('Flowsheet_Class')
 
-# Import your custom modules (optional)
-try:
-    from Flowsheet_Class.flowsheet import Flowsheet
-    from Flowsheet_Class.nx_to_sfiles import NetworkXToSFILES
-    from Flowsheet_Class.utils_visualization import FlowsheetVisualizer
-    from Flowsheet_Class.OntoCape_SFILES_mapping import OntoCapEMapper
-    HAS_CUSTOM_MODULES = True
-except ImportError as e:
-    print(f"Warning: Could not import custom modules: {e}")
-    print("Using mock implementations instead")
-    HAS_CUSTOM_MODULES = False
+class UnitKind(IntEnum):
+    """Integer codes for mock flowsheet unit types"""
+    FEED = 0
+    REACTOR = 1
+    SEPARATOR = 2
+    PRODUCT = 3
+    HEAT_EXCHANGER = 4
+    PUMP = 5
+    COMPRESSOR = 6
+    MIXER = 7
+    SPLITTER = 8
+    UNKNOWN = 9
+
+
+# SFILES notation indexed by UnitKind
+_NOTATION = ('FEED', 'CSTR', 'SEP', 'PRODUCT', 'HX', 'PUMP', 'COMP', 'MIX', 'SPLIT', 'UNIT')
+
+# UnitKind for each unit type name used in flowsheet dicts
+_UNIT_KINDS = {
+    'Feed': UnitKind.FEED,
+    'Reactor': UnitKind.REACTOR,
+    'Separator': UnitKind.SEPARATOR,
+    'Product': UnitKind.PRODUCT,
+    'HeatExchanger': UnitKind.HEAT_EXCHANGER,
+    'Pump': UnitKind.PUMP,
+    'Compressor': UnitKind.COMPRESSOR,
+    'Mixer': UnitKind.MIXER,
+    'Splitter': UnitKind.SPLITTER
+}
+
+
+def _unit_kind(unit):
+    """UnitKind of a flowsheet unit dict, from its 'type_code' if valid, else its 'type'"""
+    if 'type_code' in unit:
+        try:
+            return UnitKind(unit['type_code'])
+        except ValueError:
+            pass
+    return _UNIT_KINDS.get(unit['type'], UnitKind.UNKNOWN)
+
+
+# Upper bound (width, height) in pixels for decoding images for display
+_DISPLAY_SIZE = (1280, 800)
+
+
+def _init_worker():
+    """Use a non-interactive matplotlib backend in worker processes"""
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+@dataclass(frozen=True)
+class _Job:
+    """Paths for processing one PFD image, derived once per image"""
+    image_name: str
+    stem: str
+    image_path: Path
+    graph_out: Path
+    sfiles_out: Path
+    flow_out: Path
 
 
 class SFILESDemo:
@@ -52,91 +100,148 @@ class SFILESDemo:
         
         # Supported image formats
         self.supported_formats = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff']
+        self._ext_re = re.compile(
+            r'\.(' + '|'.join(re.escape(fmt[1:]) for fmt in self.supported_formats) + r')\Z',
+            re.IGNORECASE
+        )
+        self._available_images = None
+        self._colliding_stems = frozenset()
         
     def get_available_images(self):
-        """Get list of available PFD images"""
-        images = []
-        for fmt in self.supported_formats:
-            pattern = str(self.image_dir / f"*{fmt}")
-            images.extend(glob.glob(pattern, recursive=False))
+        """
+        Get available PFD images (scanned once and cached)
         
-        return sorted([Path(img).name for img in images])
+        Returns:
+            list[os.DirEntry]: Image entries sorted by name
+        """
+        if self._available_images is None:
+            with os.scandir(self.image_dir) as entries:
+                self._available_images = sorted(
+                    (e for e in entries if self._ext_re.search(e.name) and e.is_file()),
+                    key=lambda e: e.name
+                )
+            # Stems shared by several images (e.g. x.png and x.jpg) need distinct output names
+            stem_counts = Counter(Path(e.name).stem.lower() for e in self._available_images)
+            self._colliding_stems = frozenset(stem for stem, n in stem_counts.items() if n > 1)
+        
+        return self._available_images
     
-    def display_image(self, image_name):
-        """Display a PFD image"""
-        image_path = self.image_dir / image_name
-        if not image_path.exists():
-            print(f"Image {image_name} not found in {self.image_dir}")
-            return
+    def __getstate__(self):
+        """Drop the cached scan when pickling, os.DirEntry is not picklable"""
+        state = self.__dict__.copy()
+        state['_available_images'] = None
+        return state
+    
+    def _make_job(self, entry):
+        """Build the input and output paths for an image entry"""
+        name = Path(entry.name)
+        stem = name.stem
+        base = f"{stem}_{name.suffix[1:]}" if stem.lower() in self._colliding_stems else stem
+        return _Job(
+            image_name=entry.name,
+            stem=stem,
+            image_path=Path(entry.path),
+            graph_out=self.output_dir / f"{base}_graph.png",
+            sfiles_out=self.output_dir / f"{base}_sfiles.txt",
+            flow_out=self.output_dir / f"{base}_flowsheet.txt",
+        )
+    
+    def display_image(self, job):
+        """Display a PFD image, returning False if the image file could not be opened"""
+        # Deferred: matplotlib and PIL are only needed when something is drawn
+        import matplotlib.pyplot as plt
+        from PIL import Image
+        
+        try:
+            img = Image.open(job.image_path)
+        except OSError as e:
+            print(f"Image {job.image_name} could not be opened: {e}")
+            return False
         
+        # Display errors are reported but do not stop processing
         try:
-            img = Image.open(image_path)
+            # Decode no more pixels than the figure can show
+            if img.format == 'JPEG':
+                img.draft('RGB', _DISPLAY_SIZE)
+            img.thumbnail(_DISPLAY_SIZE, Image.BILINEAR)
             plt.figure(figsize=(12, 8))
             plt.imshow(img)
             plt.axis('off')
-            plt.title(f"PFD Image: {image_name}")
+            plt.title(f"PFD Image: {job.image_name}")
             plt.tight_layout()
             plt.show()
         except Exception as e:
             print(f"Error displaying image: {e}")
+        finally:
+            img.close()
+        
+        return True
     
-    def process_pfd_image(self, image_name):
+    def process_pfd_image(self, entry):
         """
         Process a PFD image and convert to SFILES representation
         
         Args:
-            image_name (str): Name of the image file
+            entry (os.DirEntry): Image entry from get_available_images
         """
-        image_path = self.image_dir / image_name
-        if not image_path.exists():
-            print(f"Image {image_name} not found")
-            return None
+        job = self._make_job(entry)
         
         print(f"\n{'='*60}")
-        print(f"Processing PFD Image: {image_name}")
+        print(f"Processing PFD Image: {job.image_name}")
         print(f"{'='*60}")
         
+        # Step 1: Load and display the image
+        print(f"[{job.image_name}] Step 1: Loading PFD image...")
+        if not self.display_image(job):
+            return None
+        
+        return self._process_no_display(job)
+    
+    def _process_no_display(self, job):
+        """
+        Run the flowsheet, graph, SFILES and save steps for a PFD image
+        without opening any windows, so it can also run in a worker process
+        
+        Args:
+            job (_Job): Paths for the image being processed
+        """
         try:
-            # Step 1: Load and display the image
-            print("Step 1: Loading PFD image...")
-            self.display_image(image_name)
-            
             # Step 2: Create flowsheet object (mock implementation)
-            print("Step 2: Creating flowsheet representation...")
-            flowsheet = self.create_mock_flowsheet(image_name)
+            print(f"[{job.image_name}] Step 2: Creating flowsheet representation...")
+            flowsheet = self.create_mock_flowsheet(job)
 
             # Step 2.1: Build a NetworkX graph from the flowsheet and visualize it
-            print("Step 2.1: Building NetworkX graph and saving visualization...")
+            print(f"[{job.image_name}] Step 2.1: Building NetworkX graph and saving visualization...")
             G = self.build_networkx_graph(flowsheet)
-            self.save_networkx_graph_image(G, image_name)
+            self.save_networkx_graph_image(G, job)
             
             # Step 3: Convert to SFILES notation
-            print("Step 3: Converting to SFILES notation...")
+            print(f"[{job.image_name}] Step 3: Converting to SFILES notation...")
             sfiles_string = self.convert_to_sfiles(flowsheet)
             
             # Step 4: Save results
-            print("Step 4: Saving results...")
-            self.save_results(image_name, sfiles_string, flowsheet)
+            print(f"[{job.image_name}] Step 4: Saving results...")
+            self.save_results(job, sfiles_string, flowsheet)
             
             return sfiles_string
             
         except Exception as e:
-            print(f"Error processing image {image_name}: {e}")
+            print(f"Error processing image {job.image_name}: {e}")
             return None
     
-    def create_mock_flowsheet(self, image_name):
+    def create_mock_flowsheet(self, job):
         """
         Create a mock flowsheet object for demonstration
         In a real implementation, this would analyze the image
         """
         # Mock flowsheet data based on typical PFD components
         flowsheet_data = {
-            'name': image_name.split('.')[0],
+            'name': job.stem,
             'units': [
-                {'id': 'F-101', 'type': 'Feed', 'position': (50, 200)},
-                {'id': 'R-101', 'type': 'Reactor', 'position': (200, 200)},
-                {'id': 'S-101', 'type': 'Separator', 'position': (350, 200)},
-                {'id': 'P-101', 'type': 'Product', 'position': (500, 200)}
+                {'id': 'F-101', 'type': 'Feed', 'type_code': UnitKind.FEED, 'position': (50, 200)},
+                {'id': 'R-101', 'type': 'Reactor', 'type_code': UnitKind.REACTOR, 'position': (200, 200)},
+                {'id': 'S-101', 'type': 'Separator', 'type_code': UnitKind.SEPARATOR, 'position': (350, 200)},
+                {'id': 'P-101', 'type': 'Product', 'type_code': UnitKind.PRODUCT, 'position': (500, 200)}
             ],
             'streams': [
                 {'from': 'F-101', 'to': 'R-101', 'name': 'S1'},
@@ -158,29 +263,29 @@ class SFILESDemo:
             str: SFILES string representation
         """
         # Mock SFILES conversion - in reality this would be more complex
-        sfiles_parts = []
+        buf = io.StringIO()
+        kinds_by_id = {unit['id']: _unit_kind(unit) for unit in flowsheet['units']}
         
         # Add feed streams
-        feeds = [unit for unit in flowsheet['units'] if unit['type'] == 'Feed']
-        for feed in feeds:
-            sfiles_parts.append(f"FEED({feed['id']})")
+        for unit in flowsheet['units']:
+            if _unit_kind(unit) == UnitKind.FEED:
+                buf.write(f"FEED({unit['id']})")
         
         # Add process units with connections
         for stream in flowsheet['streams']:
-            from_unit = next(u for u in flowsheet['units'] if u['id'] == stream['from'])
-            to_unit = next(u for u in flowsheet['units'] if u['id'] == stream['to'])
+            from_id = stream['from']
+            to_id = stream['to']
+            from_kind = kinds_by_id[from_id]
             
-            if from_unit['type'] != 'Feed':
-                unit_notation = self.get_unit_notation(from_unit['type'])
-                sfiles_parts.append(f"{unit_notation}({from_unit['id']})")
+            if from_kind != UnitKind.FEED:
+                buf.write(f"{_NOTATION[from_kind]}({from_id})")
             
-            sfiles_parts.append(f">{stream['name']}>")
+            if kinds_by_id[to_id] == UnitKind.PRODUCT:
+                buf.write(f">{stream['name']}>PRODUCT({to_id})")
+            else:
+                buf.write(f">{stream['name']}>")
             
-            if to_unit['type'] == 'Product':
-                sfiles_parts.append(f"PRODUCT({to_unit['id']})")
-            
-        # Join parts into SFILES string
-        sfiles_string = "".join(sfiles_parts)
+        sfiles_string = buf.getvalue()
         
         return sfiles_string
 
@@ -198,12 +303,13 @@ class SFILESDemo:
             G.add_edge(stream['from'], stream['to'], name=stream['name'])
         return G
 
-    def save_networkx_graph_image(self, G, image_name):
+    def save_networkx_graph_image(self, G, job):
         """
         Save a visualization of the NetworkX graph to the output directory and display it.
         """
-        base_name = image_name.split('.')[0]
-        out_path = self.output_dir / f"{base_name}_graph.png"
+        import matplotlib.pyplot as plt
+        
+        out_path = job.graph_out
 
         # Determine positions: use provided positions if any; else spring layout
         pos_attr = nx.get_node_attributes(G, 'pos')
@@ -225,38 +331,35 @@ class SFILESDemo:
     
     def get_unit_notation(self, unit_type):
         """Get SFILES notation for unit type"""
-        notation_map = {
-            'Reactor': 'CSTR',
-            'Separator': 'SEP',
-            'HeatExchanger': 'HX',
-            'Pump': 'PUMP',
-            'Compressor': 'COMP',
-            'Mixer': 'MIX',
-            'Splitter': 'SPLIT'
-        }
-        return notation_map.get(unit_type, 'UNIT')
+        return _NOTATION[_UNIT_KINDS.get(unit_type, UnitKind.UNKNOWN)]
     
-    def save_results(self, image_name, sfiles_string, flowsheet):
+    def save_results(self, job, sfiles_string, flowsheet):
         """Save processing results to files"""
-        base_name = image_name.split('.')[0]
-        
         # Save SFILES string
-        sfiles_file = self.output_dir / f"{base_name}_sfiles.txt"
+        sfiles_file = job.sfiles_out
         with open(sfiles_file, 'w') as f:
-            f.write(f"# SFILES 2.0 representation for {image_name}\n")
-            f.write(f"# Generated by SFILES Demo\n\n")
-            f.write(sfiles_string)
+            f.write(
+                f"# SFILES 2.0 representation for {job.image_name}\n"
+                "# Generated by SFILES Demo\n\n"
+                f"{sfiles_string}"
+            )
         
         # Save flowsheet data
-        flowsheet_file = self.output_dir / f"{base_name}_flowsheet.txt"
-        with open(flowsheet_file, 'w') as f:
-            f.write(f"# Flowsheet data for {image_name}\n\n")
-            f.write("Units:\n")
-            for unit in flowsheet['units']:
-                f.write(f"  {unit['id']}: {unit['type']} at {unit['position']}\n")
-            f.write("\nStreams:\n")
-            for stream in flowsheet['streams']:
-                f.write(f"  {stream['name']}: {stream['from']} -> {stream['to']}\n")
+        flowsheet_file = job.flow_out
+        unit_lines = "".join(
+            f"  {unit['id']}: {unit['type']} at {unit['position']}\n"
+            for unit in flowsheet['units']
+        )
+        stream_lines = "".join(
+            f"  {stream['name']}: {stream['from']} -> {stream['to']}\n"
+            for stream in flowsheet['streams']
+        )
+        with open(flowsheet_file, 'w', buffering=1 << 20) as f:
+            f.write(
+                f"# Flowsheet data for {job.image_name}\n\n"
+                f"Units:\n{unit_lines}"
+                f"\nStreams:\n{stream_lines}"
+            )
         
         print(f"Results saved to {sfiles_file} and {flowsheet_file}")
     
@@ -275,15 +378,17 @@ class SFILESDemo:
         
         print(f"Found {len(images)} PFD images:")
         for i, img in enumerate(images, 1):
-            print(f"  {i}. {img}")
+            print(f"  {i}. {img.name}")
         
         print(f"\nProcessing all images...")
         
+        # Images are independent, so process them in parallel without display
         results = {}
-        for image in images:
-            sfiles_result = self.process_pfd_image(image)
-            if sfiles_result:
-                results[image] = sfiles_result
+        jobs = [self._make_job(image) for image in images]
+        with ProcessPoolExecutor(initializer=_init_worker) as executor:
+            for job, sfiles_result in zip(jobs, executor.map(self._process_no_display, jobs, chunksize=4)):
+                if sfiles_result:
+                    results[job.image_name] = sfiles_result
         
         # Summary
         print("\n" + "=" * 60)
@@ -311,7 +416,7 @@ class SFILESDemo:
             print("=" * 40)
             print("Available images:")
             for i, img in enumerate(images, 1):
-                print(f"  {i}. {img}")
+                print(f"  {i}. {img.name}")
             print(f"  0. Exit")
             
             try:
@@ -358,7 +463,7 @@ def main():
     
     # Ask user for demo type
     print("\nSelect demonstration mode:")
-    print("1. Process all images automatically (shows graphs for each)")
+    print("1. Process all images automatically (in parallel, saves graphs for each)")
     print("2. Interactive mode (select individual images)")
     print("3. Exit")
     